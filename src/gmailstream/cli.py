@@ -1,3 +1,4 @@
+import csv
 import json
 import logging
 import re
@@ -13,10 +14,35 @@ from gmail_streamer.gmail_client import (
     fetch_attachments,
     fetch_message_metadata,
     fetch_raw_message,
+    is_not_found,
     search_messages,
 )
 from gmail_streamer.paths import get_profiles_dir, list_profiles, resolve_profile
-from gmail_streamer.storage import save_attachments, save_eml, save_metadata, scan_downloaded_metadata
+from gmail_streamer.scheduling import (
+    DOWNLOAD_CALLS_PER_MESSAGE,
+    ORDERS,
+    Budget,
+    format_size,
+    order_messages,
+    parse_duration,
+    parse_size,
+    plan_downloads,
+)
+from gmail_streamer.storage import (
+    CATALOG_FIELDS,
+    MAX_PENDING_ATTEMPTS,
+    append_catalog,
+    compact_catalog,
+    has_catalog,
+    iter_catalog,
+    load_pending,
+    migrate_metadata_files,
+    save_attachments,
+    save_eml,
+    save_metadata,
+    save_pending,
+    scan_downloaded_metadata,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +60,32 @@ def _validate_date(value: str | None, param_name: str):
         )
 
 
+def _parse_option(parser, value: str | None, param_name: str):
+    """Parse an optional CLI value, converting ValueError into a click error."""
+    if value is None:
+        return None
+    try:
+        return parser(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint=f"'--{param_name}'")
+
+
+def _retry_entry(entry: dict, error: Exception, attempts: dict[str, int]) -> dict | None:
+    """Return a failed message's pending entry with its attempt count, or None to drop it.
+
+    Messages Gmail reports as gone are dropped at once, others after MAX_PENDING_ATTEMPTS.
+    """
+    msg_id = entry["id"]
+    count = attempts.get(msg_id, 0) + 1
+    if is_not_found(error):
+        click.echo(f"  Warning: {msg_id} no longer exists, dropping it.", err=True)
+        return None
+    if count >= MAX_PENDING_ATTEMPTS:
+        click.echo(f"  Warning: giving up on {msg_id} after {count} failed attempts.", err=True)
+        return None
+    return {**entry, "attempts": count}
+
+
 @click.group()
 @click.option(
     "--profile-dir",
@@ -58,11 +110,44 @@ def main(ctx, profile_dir, verbose):
 @click.argument("profile")
 @click.option("--from", "from_date", default=None, type=str, help="Start date (YYYY-MM-DD)")
 @click.option("--to", "to_date", default=None, type=str, help="End date (YYYY-MM-DD)")
+@click.option(
+    "--order",
+    default=None,
+    type=click.Choice(ORDERS),
+    help="Download order (overrides the profile's 'order').",
+)
+@click.option(
+    "--max-bytes",
+    default=None,
+    type=str,
+    help="Stop before exceeding this size (e.g. 500M, 2G).",
+)
+@click.option(
+    "--max-messages",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Stop after this many messages.",
+)
+@click.option(
+    "--deadline",
+    default=None,
+    type=str,
+    help="Stop starting new requests after this long (e.g. 90, 30m, 2h).",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Print projected bytes and API calls without downloading.",
+)
 @click.pass_context
-def run(ctx, profile, from_date, to_date):
+def run(ctx, profile, from_date, to_date, order, max_bytes, max_messages, deadline, plan):
     """Download messages for a profile."""
     _validate_date(from_date, "from")
     _validate_date(to_date, "to")
+    max_bytes = _parse_option(parse_size, max_bytes, "max-bytes")
+    deadline = _parse_option(parse_duration, deadline, "deadline")
+    budget = Budget.from_limits(max_bytes, max_messages, deadline)
 
     profiles_dir = ctx.obj["profiles_dir"]
     profile_path = resolve_profile(profile, profiles_dir)
@@ -71,12 +156,23 @@ def run(ctx, profile, from_date, to_date):
         raise click.ClickException(f"Profile directory not found: {profile_path}")
 
     config = load_config(profile_path)
+    order = order or config.order
     target = Path(config.target_directory)
     target.mkdir(parents=True, exist_ok=True)
 
     click.echo(f"Authenticating profile '{profile_path.name}'...")
     service = get_gmail_service(profile_path)
 
+    try:
+        pending = load_pending(target)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    attempts = {entry["id"]: entry.get("attempts", 0) for entry in pending}
+    pending_by_id = {
+        entry["id"]: {key: value for key, value in entry.items() if key != "attempts"}
+        for entry in pending
+    }
+
     if from_date or to_date:
         # Explicit date range mode — ignore incremental tracking
         downloaded_ids, _ = scan_downloaded_metadata(target, from_date=from_date, to_date=to_date)
@@ -84,12 +180,16 @@ def run(ctx, profile, from_date, to_date):
         click.echo(f"Searching: {config.filter}")
         msg_ids = search_messages(service, config.filter, after_date=from_date, before_date=to_date)
     else:
-        # Incremental mode (existing behavior)
+        # Incremental mode (existing behavior), plus messages a previous run deferred
         downloaded_ids, most_recent_date = scan_downloaded_metadata(target)
         if most_recent_date:
             click.echo(f"Resuming from {most_recent_date} ({len(downloaded_ids)} already downloaded)")
+        if pending:
+            click.echo(f"Continuing {len(pending)} messages deferred by the previous run")
         click.echo(f"Searching: {config.filter}")
         msg_ids = search_messages(service, config.filter, after_date=most_recent_date)
+        found = set(msg_ids)
+        msg_ids += [mid for mid in pending_by_id if mid not in found]
 
     new_ids = [mid for mid in msg_ids if mid[:8] not in downloaded_ids]
     click.echo(f"Found {len(msg_ids)} messages, {len(new_ids)} new.")
@@ -97,11 +197,80 @@ def run(ctx, profile, from_date, to_date):
     successes = 0
     failures = 0
 
+    # Collect metadata up front so sizeEstimate and date can drive ordering and budgets.
+    # Deferred messages keep their metadata in the pending file and aren't fetched again.
+    metadatas = []
+    retries = []  # failed this run; retried next run up to MAX_PENDING_ATTEMPTS
+    dropped_ids = set()  # failed for good; removed from the pending file
+    unfetched_ids = []  # cut off by the budget before their metadata was needed
+    fetched = 0
+    stop_reason = None
+    planned = Budget(max_bytes=budget.max_bytes, max_messages=budget.max_messages)
+
     for i, msg_id in enumerate(new_ids, 1):
-        click.echo(f"[{i}/{len(new_ids)}] Downloading {msg_id}...")
+        metadata = pending_by_id.get(msg_id)
+        if metadata is None or "size_estimate" not in metadata:
+            if budget.deadline_reached():
+                stop_reason = "deadline reached"
+                unfetched_ids = new_ids[i - 1:]
+                break
+            click.echo(f"[{i}/{len(new_ids)}] Fetching metadata for {msg_id}...")
+            fetched += 1
+            try:
+                metadata = fetch_message_metadata(service, msg_id)
+            except Exception as e:
+                failures += 1
+                logger.debug("Error fetching metadata for message %s", msg_id, exc_info=True)
+                click.echo(f"  Failed: {e}", err=True)
+                retry = _retry_entry({"id": msg_id}, e, attempts)
+                if retry:
+                    retries.append(retry)
+                else:
+                    dropped_ids.add(msg_id)
+                continue
+        metadatas.append(metadata)
+
+        if order == "search":
+            # Search order is final, so stop fetching once the count/byte limits are spent
+            stop_reason = planned.check(metadata["size_estimate"])
+            if stop_reason:
+                unfetched_ids = new_ids[i:]
+                break
+            planned.charge(metadata["size_estimate"])
+
+    metadatas = order_messages(metadatas, order)
+    scheduled, deferred, plan_reason = plan_downloads(metadatas, budget)
+    stop_reason = stop_reason or plan_reason
+
+    if plan:
+        scheduled_bytes = sum(m["size_estimate"] for m in scheduled)
+        deferred_bytes = sum(m["size_estimate"] for m in deferred)
+        calls = len(scheduled) * DOWNLOAD_CALLS_PER_MESSAGE[config.mode]
+        click.echo(f"Plan ({order} order, mode {config.mode}):")
+        click.echo(f"  Scheduled : {len(scheduled)} messages, {format_size(scheduled_bytes)}")
+        click.echo(
+            f"  Deferred  : {len(deferred) + len(unfetched_ids)} messages, "
+            f"{format_size(deferred_bytes)} known"
+        )
+        click.echo(f"  API calls : {fetched} metadata + {calls} download (+1 per attachment)")
+        return
+
+    total_new = len(scheduled)
+    downloaded_now: set[str] = set()
+
+    for i, metadata in enumerate(scheduled, 1):
+        msg_id = metadata["id"]
+        size = metadata["size_estimate"]
+        reason = budget.check(size)
+        if reason:
+            stop_reason = reason
+            deferred = scheduled[i - 1:] + deferred
+            break
+
+        click.echo(f"[{i}/{total_new}] Downloading {msg_id} ({format_size(size)})...")
+        budget.charge(size)
 
         try:
-            metadata = fetch_message_metadata(service, msg_id)
             date = metadata["date"]
             subject = metadata.get("subject", "")
 
@@ -119,24 +288,146 @@ def run(ctx, profile, from_date, to_date):
                 else:
                     click.echo(f"  No attachments for {msg_id}")
 
-            save_metadata(target, msg_id, date, subject, metadata)
+            if config.metadata == "catalog":
+                append_catalog(target, metadata)
+            else:
+                save_metadata(target, msg_id, date, subject, metadata)
+            downloaded_now.add(msg_id)
             successes += 1
 
         except Exception as e:
             failures += 1
             logger.debug("Error processing message %s", msg_id, exc_info=True)
             click.echo(f"  Failed: {e}", err=True)
+            retry = _retry_entry(metadata, e, attempts)
+            if retry:
+                retries.append(retry)
+            else:
+                dropped_ids.add(msg_id)
+
+    remaining = len(deferred) + len(unfetched_ids)
+    if remaining:
+        click.echo(
+            f"Stopped: {stop_reason}. {remaining} messages "
+            f"({format_size(sum(m['size_estimate'] for m in deferred))} known) "
+            "deferred to the next run."
+        )
+
+    # Requeue deferred and failed messages, and keep earlier deferrals this run didn't
+    # handle (e.g. outside a --from/--to range)
+    deferred += [{"id": mid} for mid in unfetched_ids]
+    requeued = [
+        {**entry, "attempts": attempts[entry["id"]]} if attempts.get(entry["id"]) else entry
+        for entry in deferred
+    ] + retries
+    skip = downloaded_now | dropped_ids | {entry["id"] for entry in requeued}
+    carried = [
+        entry for entry in pending
+        if entry["id"] not in skip and entry["id"][:8] not in downloaded_ids
+    ]
+    save_pending(target, requeued + carried)
 
     total = successes + failures
     if total > 0:
         click.echo(f"Done. Downloaded {successes}/{total}, {failures} failed.")
+    elif remaining:
+        click.echo(f"Done. Nothing downloaded, {remaining} messages deferred.")
     else:
         click.echo("Done. No new messages to download.")
 
-    if total > 0 and successes == 0:
+    if (total > 0 or remaining) and successes == 0:
         ctx.exit(1)
 
 
+@main.command()
+@click.argument("profile")
+@click.option("--from", "from_date", default=None, type=str, help="Start date (YYYY-MM-DD)")
+@click.option("--to", "to_date", default=None, type=str, help="End date (YYYY-MM-DD)")
+@click.option(
+    "--format", "fmt",
+    default=None,
+    type=click.Choice(["jsonl", "csv"]),
+    help="Export format (default: jsonl).",
+)
+@click.option(
+    "--output", "-o",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Write to a file instead of stdout.",
+)
+@click.option(
+    "--migrate",
+    is_flag=True,
+    default=False,
+    help="Move per-message metadata.json files into the catalog.",
+)
+@click.option("--compact", is_flag=True, default=False, help="Remove duplicate catalog entries.")
+@click.option(
+    "--parquet",
+    is_flag=True,
+    default=False,
+    help="With --compact, also write catalog.parquet (needs pyarrow).",
+)
+@click.pass_context
+def catalog(ctx, profile, from_date, to_date, fmt, output, migrate, compact, parquet):
+    """Export, migrate or compact a profile's per-month metadata catalog."""
+    _validate_date(from_date, "from")
+    _validate_date(to_date, "to")
+    if parquet and not compact:
+        raise click.BadParameter("--parquet requires --compact", param_hint="'--parquet'")
+    if (migrate or compact) and (from_date or to_date or fmt or output):
+        raise click.UsageError("--from/--to/--format/--output only apply to exporting, "
+                               "not to --migrate or --compact.")
+
+    profiles_dir = ctx.obj["profiles_dir"]
+    profile_path = resolve_profile(profile, profiles_dir)
+
+    if not profile_path.is_dir():
+        raise click.ClickException(f"Profile directory not found: {profile_path}")
+
+    config = load_config(profile_path)
+    target = Path(config.target_directory)
+
+    if migrate and config.metadata != "catalog":
+        raise click.ClickException(
+            f"Profile '{profile_path.name}' uses 'metadata: files'. Set 'metadata: catalog' in "
+            "its config.yaml before migrating, or later runs will keep writing metadata.json "
+            "files that the catalog export doesn't include."
+        )
+
+    if migrate or compact:
+        if migrate:
+            migrated = migrate_metadata_files(target)
+            click.echo(f"Migrated {migrated} metadata.json files into the catalog.")
+        if compact:
+            try:
+                months = compact_catalog(target, parquet=parquet)
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+            click.echo(f"Compacted {months} monthly catalogs.")
+        return
+
+    if not has_catalog(target):
+        raise click.ClickException(
+            f"No catalog.jsonl found in {target}. Set 'metadata: catalog' in the profile "
+            f"or run 'gmailstream catalog {profile} --migrate' to convert metadata.json files."
+        )
+
+    entries = iter_catalog(target, from_date=from_date, to_date=to_date)
+    with click.open_file(output or "-", "w", encoding="utf-8") as out:
+        if fmt == "csv":
+            writer = csv.DictWriter(
+                out, fieldnames=CATALOG_FIELDS, extrasaction="ignore", lineterminator="\n"
+            )
+            writer.writeheader()
+            for entry in entries:
+                labels = ";".join(map(str, entry.get("label_ids") or []))
+                writer.writerow({**entry, "label_ids": labels})
+        else:
+            for entry in entries:
+                out.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
 @main.group("profiles")
 def profiles_group():
     """Manage profiles."""
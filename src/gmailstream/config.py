@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from pathlib import Path
 
 import yaml
+from gmail_streamer.scheduling import ORDERS
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +13,16 @@ class ProfileConfig:
     filter: str
     target_directory: str
     mode: str = "full"  # "full" or "attachments_only"
+    order: str = "search"  # "search", "newest", "oldest" or "smallest"
+    metadata: str = "files"  # "files" (per-message metadata.json) or "catalog" (monthly JSONL)
 
     def __post_init__(self):
         if self.mode not in ("full", "attachments_only"):
             raise ValueError(f"Invalid mode: {self.mode!r}. Must be 'full' or 'attachments_only'.")
+        if self.order not in ORDERS:
+            raise ValueError(f"Invalid order: {self.order!r}. Must be one of {', '.join(ORDERS)}.")
+        if self.metadata not in ("files", "catalog"):
+            raise ValueError(f"Invalid metadata: {self.metadata!r}. Must be 'files' or 'catalog'.")
 
 
 def load_config(profile_dir: Path) -> ProfileConfig:
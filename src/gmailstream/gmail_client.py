@@ -26,6 +26,11 @@ def _retry_api_call(fn, max_retries=3):
     raise RuntimeError(f"API call failed after {max_retries} retries")
 
 
+def is_not_found(error: Exception) -> bool:
+    """Return True if error is a Gmail API 404, e.g. the message was deleted."""
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
 def search_messages(
     service, query: str, after_date: str | None = None, before_date: str | None = None
 ) -> list[str]:
@@ -61,7 +66,10 @@ def fetch_raw_message(service, msg_id: str) -> bytes:
 
 
 def fetch_message_metadata(service, msg_id: str) -> dict:
-    """Fetch message metadata and return a dict with key fields."""
+    """Fetch message metadata and return a dict with key fields.
+
+    Includes Gmail's sizeEstimate (bytes) and the internal timestamp (ms) used for scheduling.
+    """
     logger.debug("Fetching metadata for %s", msg_id)
     msg = _retry_api_call(
         lambda: service.users().messages().get(
@@ -71,8 +79,8 @@ def fetch_message_metadata(service, msg_id: str) -> dict:
     )
 
     headers = {h["name"]: h["value"] for h in msg.get("payload", {}).get("headers", [])}
-    internal_ts = int(msg.get("internalDate", "0")) / 1000
-    internal_date = datetime.fromtimestamp(internal_ts, tz=timezone.utc).strftime("%Y-%m-%d")
+    internal_ms = int(msg.get("internalDate", "0"))
+    internal_date = datetime.fromtimestamp(internal_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
 
     return {
         "id": msg_id,
@@ -82,6 +90,8 @@ def fetch_message_metadata(service, msg_id: str) -> dict:
         "to": headers.get("To", ""),
         "snippet": msg.get("snippet", ""),
         "label_ids": msg.get("labelIds", []),
+        "size_estimate": msg.get("sizeEstimate", 0),
+        "timestamp": internal_ms,
     }
 
 
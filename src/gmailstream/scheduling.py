@@ -0,0 +1,121 @@
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+ORDERS = ("search", "newest", "oldest", "smallest")
+
+# Download API calls per message, on top of the metadata fetch used for scheduling.
+# Each attachment costs one extra call that can't be known before the full fetch.
+DOWNLOAD_CALLS_PER_MESSAGE = {"full": 2, "attachments_only": 1}
+
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+_DURATION_RE = re.compile(r"^(\d+)\s*([smh]?)$", re.IGNORECASE)
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size like '500M', '2GB' or '1024' (binary units) into bytes."""
+    match = _SIZE_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid size '{value}'. Expected e.g. 500M, 2G, 1024")
+    number, unit = match.groups()
+    return int(float(number) * _SIZE_UNITS[unit.lower()])
+
+
+def parse_duration(value: str) -> int:
+    """Parse a duration like '90', '30m' or '2h' into seconds."""
+    match = _DURATION_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration '{value}'. Expected e.g. 90, 30m, 2h")
+    number, unit = match.groups()
+    return int(number) * _DURATION_UNITS[unit.lower()]
+
+
+def format_size(num_bytes: int) -> str:
+    """Format a byte count for display."""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def order_messages(metadatas: list[dict], order: str) -> list[dict]:
+    """Return message metadata sorted by the given order.
+
+    "search" keeps the order returned by the Gmail search.
+    """
+    if order == "newest":
+        return sorted(metadatas, key=lambda m: m.get("timestamp", 0), reverse=True)
+    if order == "oldest":
+        return sorted(metadatas, key=lambda m: m.get("timestamp", 0))
+    if order == "smallest":
+        return sorted(metadatas, key=lambda m: m.get("size_estimate", 0))
+    if order == "search":
+        return list(metadatas)
+    raise ValueError(f"Invalid order: {order!r}. Must be one of {', '.join(ORDERS)}.")
+
+
+@dataclass
+class Budget:
+    """Limits on a single run. A None limit is unbounded."""
+
+    max_bytes: int | None = None
+    max_messages: int | None = None
+    deadline: float | None = None  # time.monotonic() value
+    bytes_used: int = 0
+    messages_used: int = 0
+
+    @classmethod
+    def from_limits(
+        cls, max_bytes: int | None, max_messages: int | None, duration: int | None
+    ) -> "Budget":
+        deadline = time.monotonic() + duration if duration is not None else None
+        return cls(max_bytes=max_bytes, max_messages=max_messages, deadline=deadline)
+
+    def deadline_reached(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def check(self, size: int) -> str | None:
+        """Return the reason a message of `size` bytes doesn't fit, or None if it does.
+
+        The first message always fits the byte limit, so one message larger than the
+        whole budget can't block the queue for every later run.
+        """
+        if self.max_messages is not None and self.messages_used >= self.max_messages:
+            return f"message limit of {self.max_messages} reached"
+        if (
+            self.max_bytes is not None
+            and self.messages_used
+            and self.bytes_used + size > self.max_bytes
+        ):
+            return f"byte limit of {format_size(self.max_bytes)} reached"
+        if self.deadline_reached():
+            return "deadline reached"
+        return None
+
+    def charge(self, size: int):
+        self.bytes_used += size
+        self.messages_used += 1
+
+
+def plan_downloads(
+    metadatas: list[dict], budget: Budget
+) -> tuple[list[dict], list[dict], str | None]:
+    """Split ordered metadata into (scheduled, deferred, reason) under the byte/count limits.
+
+    Stops at the first message that doesn't fit, so deferred messages keep their order.
+    The deadline is not applied here since it depends on actual download speed.
+    """
+    planned = Budget(max_bytes=budget.max_bytes, max_messages=budget.max_messages)
+    for i, meta in enumerate(metadatas):
+        reason = planned.check(meta.get("size_estimate", 0))
+        if reason:
+            return metadatas[:i], metadatas[i:], reason
+        planned.charge(meta.get("size_estimate", 0))
+    return list(metadatas), [], None
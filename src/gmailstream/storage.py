@@ -1,11 +1,23 @@
 import json
 import logging
+import os
 import re
 import unicodedata
+from collections.abc import Iterator
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+PENDING_FILE = ".pending.json"
+MAX_PENDING_ATTEMPTS = 3  # failed runs before a pending message is dropped
+CATALOG_FILE = "catalog.jsonl"
+CATALOG_PARQUET_FILE = "catalog.parquet"
+CATALOG_FIELDS = [
+    "id", "date", "from", "to", "subject", "snippet", "label_ids", "size_estimate", "timestamp",
+]
+_PARQUET_LIST_FIELDS = ("label_ids",)
+_PARQUET_INT_FIELDS = ("size_estimate", "timestamp")
+
 
 def _short_id(msg_id: str) -> str:
     return msg_id[:8]
@@ -72,6 +84,26 @@ def save_metadata(target_dir: Path, msg_id: str, date: str, subject: str, metada
         raise OSError(f"Failed to save metadata for message {msg_id} to {dest}: {e}") from e
 
 
+def append_catalog(target_dir: Path, metadata: dict):
+    """Append metadata as one compact JSON line to the month's catalog.jsonl.
+
+    Removes the month's catalog.parquet, which would otherwise be out of date until
+    the next compaction.
+    """
+    dest = _month_dir(target_dir, metadata["date"])
+    path = dest / CATALOG_FILE
+    try:
+        dest.mkdir(parents=True, exist_ok=True)
+        logger.debug("Appending %s to %s", metadata["id"], path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(metadata, ensure_ascii=False, separators=(",", ":")) + "\n")
+        (dest / CATALOG_PARQUET_FILE).unlink(missing_ok=True)
+    except OSError as e:
+        raise OSError(
+            f"Failed to append metadata for message {metadata['id']} to {path}: {e}"
+        ) from e
+
+
 def save_attachments(target_dir: Path, msg_id: str, date: str, subject: str, attachments: list[dict]):
     """Save attachments inside a per-message directory."""
     dest = _message_dir(target_dir, msg_id, date, subject)
@@ -88,6 +120,221 @@ def save_attachments(target_dir: Path, msg_id: str, date: str, subject: str, att
             raise OSError(f"Failed to save attachment '{att['filename']}' for message {msg_id}: {e}") from e
 
 
+def load_pending(target_dir: Path) -> list[dict]:
+    """Return messages deferred by a previous run, in their scheduled order.
+
+    Entries are message metadata dicts; entries holding only an "id" still need their
+    metadata fetched. Messages that failed carry an "attempts" count. Raises ValueError
+    if the file can't be read, since ignoring it would silently drop the deferred messages.
+    """
+    path = target_dir / PENDING_FILE
+    if not path.exists():
+        return []
+    try:
+        entries = json.loads(path.read_text())
+    except (json.JSONDecodeError, OSError) as e:
+        raise ValueError(f"Unreadable pending queue {path}: {e}") from e
+    if not isinstance(entries, list) or not all(
+        isinstance(entry, dict) and isinstance(entry.get("id"), str) for entry in entries
+    ):
+        raise ValueError(f"Invalid pending queue {path}: expected a list of message entries")
+    return entries
+
+
+def save_pending(target_dir: Path, entries: list[dict]):
+    """Persist deferred messages so the next run picks them up. Removes the file when empty."""
+    path = target_dir / PENDING_FILE
+    try:
+        if entries:
+            logger.debug("Saving %d pending messages to %s", len(entries), path)
+            path.write_text(json.dumps(entries, ensure_ascii=False, separators=(",", ":")))
+        elif path.exists():
+            path.unlink()
+    except OSError as e:
+        raise OSError(f"Failed to save pending queue to {path}: {e}") from e
+
+
+def _month_dirs(
+    target_dir: Path, from_date: str | None = None, to_date: str | None = None
+) -> list[Path]:
+    """Return sorted YYYY-MM subdirectories, optionally limited to a YYYY-MM-DD date range."""
+    if not target_dir.is_dir():
+        return []
+    month_dirs = []
+    for month_dir in sorted(target_dir.iterdir()):
+        if not month_dir.is_dir() or len(month_dir.name) != 7:
+            continue
+        if from_date and month_dir.name < from_date[:7]:
+            continue
+        if to_date and month_dir.name > to_date[:7]:
+            continue
+        month_dirs.append(month_dir)
+    return month_dirs
+
+
+def _read_catalog(path: Path) -> list[dict]:
+    """Return catalog entries from a catalog.jsonl file, skipping lines that aren't JSON objects."""
+    if not path.exists():
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+            if not isinstance(entry, dict):
+                logger.warning("Skipping invalid line %d in %s", lineno, path)
+                continue
+            entries.append(entry)
+    return entries
+
+
+def _dedupe_entries(entries: list[dict]) -> list[dict]:
+    """Keep the last entry per message ID, preserving first-seen order."""
+    by_id = {}
+    for entry in entries:
+        by_id[entry.get("id")] = entry
+    return list(by_id.values())
+
+
+def _write_catalog(path: Path, entries: list[dict]):
+    """Atomically replace a catalog.jsonl file with the given entries."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+def has_catalog(target_dir: Path) -> bool:
+    """Return True if any month directory has a catalog.jsonl."""
+    return any((month_dir / CATALOG_FILE).exists() for month_dir in _month_dirs(target_dir))
+
+
+def iter_catalog(
+    target_dir: Path, from_date: str | None = None, to_date: str | None = None
+) -> Iterator[dict]:
+    """Yield catalog entries month by month, one per message ID, within an optional date range."""
+    for month_dir in _month_dirs(target_dir, from_date, to_date):
+        for entry in _dedupe_entries(_read_catalog(month_dir / CATALOG_FILE)):
+            date = entry.get("date", "")
+            if (from_date and date < from_date) or (to_date and date > to_date):
+                continue
+            yield entry
+
+
+def migrate_metadata_files(target_dir: Path) -> int:
+    """Move per-message metadata.json files into their month's catalog.jsonl.
+
+    Only files whose entry is in the catalog are deleted; unreadable files are left in
+    place. Message directories left empty are removed, since the catalog now records them.
+    Returns the number of migrated files.
+    """
+    migrated = 0
+    for month_dir in _month_dirs(target_dir):
+        meta_paths = sorted(month_dir.glob("*/metadata.json"))
+        if not meta_paths:
+            continue
+        catalog_path = month_dir / CATALOG_FILE
+        entries = _read_catalog(catalog_path)
+        known_ids = {entry.get("id") for entry in entries}
+        migrated_paths = []
+        for meta_path in meta_paths:
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (json.JSONDecodeError, OSError) as e:
+                logger.warning("Skipping unreadable %s: %s", meta_path, e)
+                continue
+            if not isinstance(meta, dict) or not meta.get("id"):
+                logger.warning("Skipping %s: no message id", meta_path)
+                continue
+            if meta["id"] not in known_ids:
+                entries.append(meta)
+                known_ids.add(meta["id"])
+            migrated_paths.append(meta_path)
+        if not migrated_paths:
+            continue
+        try:
+            _write_catalog(catalog_path, entries)
+            (month_dir / CATALOG_PARQUET_FILE).unlink(missing_ok=True)
+            for meta_path in migrated_paths:
+                meta_path.unlink()
+                if not any(meta_path.parent.iterdir()):
+                    meta_path.parent.rmdir()
+                migrated += 1
+        except OSError as e:
+            raise OSError(f"Failed to migrate metadata in {month_dir}: {e}") from e
+        logger.debug("Migrated %d metadata files in %s", len(migrated_paths), month_dir)
+    return migrated
+
+
+def _parquet_table(pa, schema, entries: list[dict], month_dir: Path):
+    """Build a Parquet table of catalog entries, skipping rows that don't fit the schema."""
+    rows = [{field: entry.get(field) for field in CATALOG_FIELDS} for entry in entries]
+    try:
+        return pa.Table.from_pylist(rows, schema=schema)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    valid_rows = []
+    for row in rows:
+        try:
+            pa.Table.from_pylist([row], schema=schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.warning(
+                "Leaving %s out of %s/%s: %s", row["id"], month_dir.name, CATALOG_PARQUET_FILE, e
+            )
+            continue
+        valid_rows.append(row)
+    return pa.Table.from_pylist(valid_rows, schema=schema)
+
+
+def compact_catalog(target_dir: Path, parquet: bool = False) -> int:
+    """Rewrite each month's catalog.jsonl without duplicate entries.
+
+    With parquet=True, also writes catalog.parquet next to it (requires pyarrow) with a
+    fixed CATALOG_FIELDS schema. It is current as of this compaction; later appends to
+    the month remove it. Returns the number of compacted months.
+    """
+    if parquet:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError(
+                "Parquet output requires pyarrow: pip install 'gmailstream[parquet]'"
+            ) from e
+        schema = pa.schema([
+            (
+                field,
+                pa.list_(pa.string()) if field in _PARQUET_LIST_FIELDS
+                else pa.int64() if field in _PARQUET_INT_FIELDS
+                else pa.string(),
+            )
+            for field in CATALOG_FIELDS
+        ])
+
+    compacted = 0
+    for month_dir in _month_dirs(target_dir):
+        catalog_path = month_dir / CATALOG_FILE
+        if not catalog_path.exists():
+            continue
+        entries = _dedupe_entries(_read_catalog(catalog_path))
+        try:
+            _write_catalog(catalog_path, entries)
+            if parquet:
+                pq.write_table(
+                    _parquet_table(pa, schema, entries, month_dir), month_dir / CATALOG_PARQUET_FILE
+                )
+        except OSError as e:
+            raise OSError(f"Failed to compact catalog in {month_dir}: {e}") from e
+        logger.debug("Compacted %s to %d entries", catalog_path, len(entries))
+        compacted += 1
+    return compacted
+
+
 def _scan_legacy_json_files(glob_iter, downloaded_ids: set[str], most_recent_date: str | None) -> str | None:
     """Parse old flat metadata JSON files for backward compat. Extracts short IDs."""
     for meta_path in glob_iter:
@@ -121,18 +368,19 @@ def scan_downloaded_metadata(
     most_recent_date = _scan_legacy_json_files(target_dir.glob("* - *.json"), downloaded_ids, most_recent_date)
 
     # Scan YYYY-MM subdirectories
-    for month_dir in sorted(target_dir.iterdir()):
-        if not month_dir.is_dir() or len(month_dir.name) != 7:
-            continue
-        folder_month = month_dir.name
-        if from_date and folder_month < from_date[:7]:
-            continue
-        if to_date and folder_month > to_date[:7]:
-            continue
-
+    for month_dir in _month_dirs(target_dir, from_date, to_date):
         # Scan legacy flat JSON files in month dir
         most_recent_date = _scan_legacy_json_files(month_dir.glob("* - *.json"), downloaded_ids, most_recent_date)
 
+        # Scan the month's metadata catalog (catalog mode / migrated metadata)
+        for entry in _read_catalog(month_dir / CATALOG_FILE):
+            msg_id = entry.get("id")
+            date = entry.get("date")
+            if msg_id:
+                downloaded_ids.add(_short_id(msg_id))
+            if date and (most_recent_date is None or date > most_recent_date):
+                most_recent_date = date
+
         # Scan per-message directories (new layout)
         for msg_dir in month_dir.iterdir():
             if not msg_dir.is_dir():